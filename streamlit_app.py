@@ -1,41 +1,92 @@
 import streamlit as st
+import numpy as np
 import pandas as pd
-import plotly.graph_objs as go
-from pptx import Presentation
-from pptx.util import Inches, Pt
-import tempfile
+import polars as pl
+import plotly.express as px
+import io
 import os
 from datetime import datetime
-from pptx.dml.color import RGBColor
-from pptx.enum.text import PP_ALIGN
 
-HCAHPS_PATH = 'HCAHPS.csv'
-HOSPITAL_INFO_PATH = 'Hospital_General_Information.csv'
+HCAHPS_URL = "https://www.dropbox.com/scl/fi/d35e3po3qfyaw7fz3qend/HCAHPS.csv?rlkey=pw76uj8z5270ks7izz6esx62r&st=ugsr5p6s&dl=1"
+HOSPITAL_INFO_URL = "https://www.dropbox.com/scl/fi/fq5o8a6evwpsfzutjp7uw/Hospital_General_Information.csv?rlkey=c60s0se15d6nzs40mm19a2q5v&st=li48t6ft&dl=1"
+HCAHPS_PARQUET = 'hcahps.parquet'
+HOSPITAL_INFO_PARQUET = 'hospital_info.parquet'
 
-@st.cache_data
+# The measures shown in the tool, and the answer percent to use for each;
+# the loader filters the HCAHPS extract down to exactly these IDs.
+ALL_MEASURES = [
+    ("Nurse Communication", "H_COMP_1_A_P"),
+    ("Doctor Communication", "H_COMP_2_A_P"),
+    ("Staff Responsiveness", "H_COMP_3_A_P"),
+    ("Care Transition", "H_COMP_5_A_P"),
+    ("Discharge Info", "H_COMP_6_Y_P"),
+    ("Care Cleanliness", "H_CLEAN_HSP_A_P"),
+    ("Quietness", "H_QUIET_HSP_A_P"),
+    ("Recommend", "H_RECMND_DY"),
+]
+MEASURE_IDS = [m[1] for m in ALL_MEASURES]
+
+def as_categorical(df, cols):
+    """Cast high-cardinality string columns to category dtype.
+
+    Equality and groupby then run over integer codes instead of Python
+    objects, and memory per row drops to the code width.
+    """
+    for c in cols:
+        if c in df.columns:
+            df[c] = df[c].astype('category')
+    return df
+
+# cache_resource returns a single shared DataFrame with no pickle round-trip;
+# callers must treat the loader outputs as read-only.
+@st.cache_resource
 def load_hospital_info():
     try:
+        if os.path.exists(HOSPITAL_INFO_PARQUET):
+            return as_categorical(pl.read_parquet(HOSPITAL_INFO_PARQUET).to_pandas(), ['Facility ID', 'State'])
         st.write("Loading hospital information...")
-        df = pd.read_csv("https://www.dropbox.com/scl/fi/fq5o8a6evwpsfzutjp7uw/Hospital_General_Information.csv?rlkey=c60s0se15d6nzs40mm19a2q5v&st=li48t6ft&dl=1", dtype=str)
+        df = pl.read_csv(HOSPITAL_INFO_URL, infer_schema_length=0)
+        df.write_parquet(HOSPITAL_INFO_PARQUET)
         st.write("Hospital information loaded successfully!")
-        return df
+        return as_categorical(df.to_pandas(), ['Facility ID', 'State'])
     except Exception as e:
         st.error(f"Error loading hospital information: {str(e)}")
         return pd.DataFrame()
 
-@st.cache_data
+@st.cache_resource
 def load_hcahps_data():
     try:
+        if os.path.exists(HCAHPS_PARQUET):
+            return as_categorical(pl.read_parquet(HCAHPS_PARQUET).to_pandas(), ['Facility ID', 'State', 'HCAHPS Measure ID'])
         st.write("Loading HCAHPS data...")
-        df = pd.read_csv("https://www.dropbox.com/scl/fi/d35e3po3qfyaw7fz3qend/HCAHPS.csv?rlkey=pw76uj8z5270ks7izz6esx62r&st=ugsr5p6s&dl=1", dtype=str)
-        df.columns = df.columns.str.strip()
-        df['HCAHPS Answer Percent'] = pd.to_numeric(df['HCAHPS Answer Percent'], errors='coerce')
+        df = pl.read_csv(HCAHPS_URL, infer_schema_length=0)
+        df = df.rename({c: c.strip() for c in df.columns})
+        df = (
+            df.with_columns(pl.col('HCAHPS Measure ID').str.strip_chars())
+            .filter(pl.col('HCAHPS Measure ID').is_in(MEASURE_IDS))
+            .select(['Facility ID', 'State', 'HCAHPS Measure ID', 'HCAHPS Answer Percent'])
+            .with_columns(pl.col('HCAHPS Answer Percent').cast(pl.Float64, strict=False))
+        )
+        df.write_parquet(HCAHPS_PARQUET)
         st.write("HCAHPS data loaded successfully!")
-        return df
+        return as_categorical(df.to_pandas(), ['Facility ID', 'State', 'HCAHPS Measure ID'])
     except Exception as e:
         st.error(f"Error loading HCAHPS data: {str(e)}")
         return pd.DataFrame()
 
+@st.cache_data
+def precompute_aggregates(df):
+    """Precompute national, state, and hospital mean scores per measure.
+
+    The returned series are indexed (and sorted) by their group keys, so
+    each lookup in the comparison builder is an index probe instead of a
+    scan over the full frame.
+    """
+    nat_series = df.groupby('HCAHPS Measure ID', observed=True)['HCAHPS Answer Percent'].mean().sort_index()
+    state_series = df.groupby(['State', 'HCAHPS Measure ID'], observed=True)['HCAHPS Answer Percent'].mean().sort_index()
+    hosp_series = df.groupby(['Facility ID', 'HCAHPS Measure ID'], observed=True)['HCAHPS Answer Percent'].mean().sort_index()
+    return nat_series, state_series, hosp_series
+
 st.title('🏥 Hospital HCAHPS Benchmarking Tool')
 
 with st.expander('ℹ️ What do these metrics mean? (Click to expand)', expanded=False):
@@ -65,146 +116,166 @@ with st.expander('ℹ️ What do these metrics mean? (Click to expand)', expande
 df_info = load_hospital_info()
 df_hcahps = load_hcahps_data()
 # st.write("All unique HCAHPS Answer Descriptions:", df_hcahps['HCAHPS Answer Description'].unique())
-hospital_names = df_info['Facility Name'].sort_values().unique()
-hospital = st.selectbox('Select Hospital', hospital_names)
+@st.cache_data
+def get_hospital_names(df):
+    return np.sort(df['Facility Name'].dropna().unique())
+
+hospital = st.selectbox('Select Hospital', get_hospital_names(df_info))
 
 hospital_row = df_info[df_info['Facility Name'] == hospital].iloc[0]
 hospital_id = hospital_row['Facility ID']
 hospital_state = hospital_row['State']
 
-# Define the measures and the answer description to use for each
-all_measures = [
-    ("Nurse Communication", "H_COMP_1_A_P"),
-    ("Doctor Communication", "H_COMP_2_A_P"),
-    ("Staff Responsiveness", "H_COMP_3_A_P"),
-    ("Care Transition", "H_COMP_5_A_P"),
-    ("Discharge Info", "H_COMP_6_Y_P"),
-    ("Care Cleanliness", "H_CLEAN_HSP_A_P"),
-    ("Quietness", "H_QUIET_HSP_A_P"),
-    ("Recommend", "H_RECMND_DY"),
-]
-
-metric_options = [m[0] for m in all_measures]
+metric_options = [m[0] for m in ALL_MEASURES]
 selected_metrics = st.multiselect(
     "Select metrics to display", metric_options, default=metric_options
 )
-measures = [m for m in all_measures if m[0] in selected_metrics]
-
-def match_answer(series, answer):
-    return series.str.strip().str.lower() == answer.strip().lower()
-
-comparison = []
-for label, measure_id in measures:
-    hosp_score = df_hcahps[
-        (df_hcahps['Facility ID'] == hospital_id) &
-        (df_hcahps['HCAHPS Measure ID'] == measure_id)
-    ]['HCAHPS Answer Percent'].mean()
-    state_avg = df_hcahps[
-        (df_hcahps['State'] == hospital_state) &
-        (df_hcahps['HCAHPS Measure ID'] == measure_id)
-    ]['HCAHPS Answer Percent'].mean()
-    nat_avg = df_hcahps[
-        (df_hcahps['HCAHPS Measure ID'] == measure_id)
-    ]['HCAHPS Answer Percent'].mean()
-    comparison.append({
-        'Measure': label,
-        'Hospital': hosp_score,
-        'State Avg': state_avg,
-        'National Avg': nat_avg,
-        'vs State': hosp_score - state_avg if pd.notnull(hosp_score) and pd.notnull(state_avg) else None,
-        'vs National': hosp_score - nat_avg if pd.notnull(hosp_score) and pd.notnull(nat_avg) else None
+measures = [m for m in ALL_MEASURES if m[0] in selected_metrics]
+
+@st.cache_data
+def compute_comparison(_df, hospital_id, hospital_state, measures):
+    """Build the benchmark table for one hospital and measure selection.
+
+    `_df` is excluded from the cache key (it is the cached loader output);
+    results are keyed on the hospital and the selected measures, so
+    re-picking a hospital or toggling metrics back returns instantly.
+    """
+    nat_series, state_series, hosp_series = precompute_aggregates(_df)
+    measure_ids = [m[1] for m in measures]
+    comp_df = pd.DataFrame({
+        'Measure': [m[0] for m in measures],
+        'Hospital': hosp_series.reindex([(hospital_id, m) for m in measure_ids]).to_numpy(),
+        'State Avg': state_series.reindex([(hospital_state, m) for m in measure_ids]).to_numpy(),
+        'National Avg': nat_series.reindex(measure_ids).to_numpy(),
     })
+    comp_df['vs State'] = comp_df['Hospital'] - comp_df['State Avg']
+    comp_df['vs National'] = comp_df['Hospital'] - comp_df['National Avg']
+    return comp_df
 
-comp_df = pd.DataFrame(comparison)
+comp_df = compute_comparison(df_hcahps, hospital_id, hospital_state, tuple(measures))
 
 # --- Display Table ---
+def color_benchmark_cells(df):
+    """Return a style frame: green where the hospital beats the benchmark, red where it trails."""
+    styles = pd.DataFrame('', index=df.index, columns=df.columns)
+    for c in ['vs State', 'vs National']:
+        styles[c] = np.where(df[c] > 0, 'background-color: #d4edda',
+                             np.where(df[c] < 0, 'background-color: #f8d7da', ''))
+    return styles
+
 st.subheader('Comparison Table')
-st.dataframe(comp_df[['Measure', 'Hospital', 'State Avg', 'National Avg', 'vs State', 'vs National']].style.applymap(
-    lambda v: 'background-color: #d4edda' if isinstance(v, (int, float)) and v > 0 else ('background-color: #f8d7da' if isinstance(v, (int, float)) and v < 0 else ''),
-    subset=['vs State', 'vs National']
+st.dataframe(comp_df[['Measure', 'Hospital', 'State Avg', 'National Avg', 'vs State', 'vs National']].style.apply(
+    color_benchmark_cells, axis=None
 ))
 
 # --- Visualization ---
-st.subheader('Benchmark Chart')
-fig = go.Figure()
-
 # Define consistent colors
-colors = {
-    'Hospital': 'rgb(0, 51, 102)',  # Dark blue
-    'State Avg': 'rgb(128, 128, 128)',  # Gray
-    'National Avg': 'rgb(173, 216, 230)'  # Light blue
+SERIES_COLORS = {
+    'Hospital': '#003366',  # Dark blue
+    'State Avg': '#808080',  # Gray
+    'National Avg': '#ADD8E6'  # Light blue
 }
 
-# Add traces with consistent styling
-fig.add_trace(go.Bar(
-    x=comp_df['Measure'],
-    y=comp_df['Hospital'],
-    name='Hospital',
-    marker_color=colors['Hospital'],
-    text=comp_df['Hospital'].round(1).astype(str) + '%',
-    textposition='outside'
-))
-
-fig.add_trace(go.Bar(
-    x=comp_df['Measure'],
-    y=comp_df['State Avg'],
-    name='State Avg',
-    marker_color=colors['State Avg'],
-    text=comp_df['State Avg'].round(1).astype(str) + '%',
-    textposition='outside'
-))
-
-fig.add_trace(go.Bar(
-    x=comp_df['Measure'],
-    y=comp_df['National Avg'],
-    name='National Avg',
-    marker_color=colors['National Avg'],
-    text=comp_df['National Avg'].round(1).astype(str) + '%',
-    textposition='outside'
-))
-
-# Update layout for better readability
-fig.update_layout(
-    barmode='group',
-    xaxis_title='Measure',
-    yaxis_title='Score (%)',
-    plot_bgcolor='white',
-    paper_bgcolor='white',
-    showlegend=True,
-    legend=dict(
-        orientation='h',
-        yanchor='bottom',
-        y=1.02,
-        xanchor='center',
-        x=0.5
-    ),
-    margin=dict(t=100),  # Add top margin for value labels
-    font=dict(size=14),
-    xaxis=dict(
-        tickfont=dict(size=12),
-        title=dict(
-            text='Measure',
-            font=dict(size=14)
-        )
-    ),
-    yaxis=dict(
-        tickfont=dict(size=12),
-        title=dict(
-            text='Score (%)',
-            font=dict(size=14)
+def make_benchmark_figure(comp_df):
+    """Build the grouped benchmark bar chart for the interactive view."""
+    # Melt to long form so plotly serializes one batched bar chart
+    long_df = comp_df.melt(
+        id_vars='Measure',
+        value_vars=['Hospital', 'State Avg', 'National Avg'],
+        var_name='Series',
+        value_name='Score'
+    )
+    fig = px.bar(
+        long_df,
+        x='Measure',
+        y='Score',
+        color='Series',
+        barmode='group',
+        text=long_df['Score'].round(1).astype(str) + '%',
+        color_discrete_map=SERIES_COLORS
+    )
+    fig.update_traces(textposition='outside')
+    fig.update_layout(
+        legend_title_text='',
+        xaxis_title='Measure',
+        yaxis_title='Score (%)',
+        plot_bgcolor='white',
+        paper_bgcolor='white',
+        showlegend=True,
+        legend=dict(
+            orientation='h',
+            yanchor='bottom',
+            y=1.02,
+            xanchor='center',
+            x=0.5
         ),
-        range=[0, 100]  # Set y-axis range to 0-100 for percentages
+        margin=dict(t=100),  # Add top margin for value labels
+        font=dict(size=14),
+        xaxis=dict(
+            tickfont=dict(size=12),
+            title=dict(
+                text='Measure',
+                font=dict(size=14)
+            )
+        ),
+        yaxis=dict(
+            tickfont=dict(size=12),
+            title=dict(
+                text='Score (%)',
+                font=dict(size=14)
+            ),
+            range=[0, 100]  # Set y-axis range to 0-100 for percentages
+        )
     )
-)
-
-# Remove chart border
-fig.update_xaxes(showline=False, showgrid=False)
-fig.update_yaxes(showline=False, showgrid=True, gridcolor='lightgray')
+    # Remove chart border
+    fig.update_xaxes(showline=False, showgrid=False)
+    fig.update_yaxes(showline=False, showgrid=True, gridcolor='lightgray')
+    return fig
 
+st.subheader('Benchmark Chart')
+fig = make_benchmark_figure(comp_df)
 st.plotly_chart(fig, use_container_width=True)
 
 # --- PowerPoint Export ---
-def create_pptx(comp_df, hospital, chart_path):
+def render_chart_png(comp_df):
+    """Render the benchmark chart to PNG bytes with matplotlib.
+
+    Kaleido launches a headless browser per write_image call; the PPTX
+    chart is static, so matplotlib avoids that cold start entirely.
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(figsize=(12, 8))
+    x = np.arange(len(comp_df))
+    width = 0.27
+    for series, offset in [('Hospital', -width), ('State Avg', 0.0), ('National Avg', width)]:
+        scores = comp_df[series]
+        bars = ax.bar(x + offset, scores.fillna(0), width, label=series, color=SERIES_COLORS[series])
+        ax.bar_label(bars, labels=[f"{v:.1f}%" if pd.notnull(v) else '' for v in scores], fontsize=10)
+    ax.set_xticks(x)
+    ax.set_xticklabels(comp_df['Measure'], rotation=30, ha='right', fontsize=12)
+    ax.set_ylabel('Score (%)', fontsize=14)
+    ax.set_ylim(0, 100)
+    ax.legend(loc='lower center', bbox_to_anchor=(0.5, 1.0), ncol=3, frameon=False, fontsize=12)
+    for side in ['top', 'right', 'left']:
+        ax.spines[side].set_visible(False)
+    ax.yaxis.grid(True, color='lightgray')
+    ax.set_axisbelow(True)
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png', dpi=150, bbox_inches='tight')
+    plt.close(fig)
+    buf.seek(0)
+    return buf
+
+def create_pptx(comp_df, hospital):
+    # Imported here so python-pptx only loads when a report is requested
+    from pptx import Presentation
+    from pptx.util import Inches, Pt
+    from pptx.dml.color import RGBColor
+    from pptx.enum.text import PP_ALIGN
+
     prs = Presentation()
     blank_layout = prs.slide_layouts[6]  # 6 is usually the fully blank layout
     slide = prs.slides.add_slide(blank_layout)
@@ -252,21 +323,22 @@ def create_pptx(comp_df, hospital, chart_path):
         cell.fill.solid()
         cell.fill.fore_color.rgb = RGBColor(221, 235, 247)  # light blue
 
+    # Pre-format every cell as a string in one vectorized pass; the fill
+    # loop then only writes text, with no per-cell type dispatch.
+    numeric_cols = ['Hospital', 'State Avg', 'National Avg', 'vs State', 'vs National']
+    formatted = comp_df.copy()
+    for c in numeric_cols:
+        formatted[c] = formatted[c].map(lambda v: f"{v:.1f}" if pd.notnull(v) else "")
+    numeric_idx = {comp_df.columns.get_loc(c) for c in numeric_cols if c in comp_df.columns}
+
     # Fill table data with right-aligned numbers
-    for i in range(rows):
-        for j in range(cols):
-            val = comp_df.iloc[i, j]
+    for i, row in enumerate(formatted.values.tolist()):
+        for j, text in enumerate(row):
             cell = table.cell(i+1, j)
-            if pd.notnull(val):
-                if isinstance(val, (int, float)):
-                    cell.text = f"{val:.1f}" if isinstance(val, float) else str(val)
-                    cell.text_frame.paragraphs[0].alignment = PP_ALIGN.RIGHT
-                else:
-                    cell.text = str(val)
-                    cell.text_frame.paragraphs[0].alignment = PP_ALIGN.LEFT
-            else:
-                cell.text = ""
-            cell.text_frame.paragraphs[0].font.size = Pt(12)
+            cell.text = text
+            paragraph = cell.text_frame.paragraphs[0]
+            paragraph.alignment = PP_ALIGN.RIGHT if j in numeric_idx else PP_ALIGN.LEFT
+            paragraph.font.size = Pt(12)
             cell.margin_left = Inches(0.05)
             cell.margin_right = Inches(0.05)
             cell.margin_top = Inches(0.01)
@@ -274,7 +346,7 @@ def create_pptx(comp_df, hospital, chart_path):
 
     # Auto-fit column widths
     for j in range(cols):
-        max_len = max([len(str(comp_df.columns[j]))] + [len(str(comp_df.iloc[i, j])) for i in range(rows)])
+        max_len = max([len(str(formatted.columns[j]))] + [len(formatted.iloc[i, j]) for i in range(rows)])
         col_width = min(max(0.12 * max_len, 1.0), 2.2)
         table.columns[j].width = Inches(col_width)
 
@@ -287,90 +359,13 @@ def create_pptx(comp_df, hospital, chart_path):
     if chart_height < Inches(2):
         chart_height = Inches(2)  # minimum height
 
-    # Create a new figure for the PowerPoint export with larger fonts and data labels
-    export_fig = go.Figure()
-    colors = {
-        'Hospital': 'rgb(0, 51, 102)',
-        'State Avg': 'rgb(128, 128, 128)',
-        'National Avg': 'rgb(173, 216, 230)'
-    }
-    export_fig.add_trace(go.Bar(
-        x=comp_df['Measure'],
-        y=comp_df['Hospital'],
-        name='Hospital',
-        marker_color=colors['Hospital'],
-        text=comp_df['Hospital'].round(1).astype(str) + '%',
-        textposition='outside',
-        textfont=dict(size=14)
-    ))
-    export_fig.add_trace(go.Bar(
-        x=comp_df['Measure'],
-        y=comp_df['State Avg'],
-        name='State Avg',
-        marker_color=colors['State Avg'],
-        text=comp_df['State Avg'].round(1).astype(str) + '%',
-        textposition='outside',
-        textfont=dict(size=14)
-    ))
-    export_fig.add_trace(go.Bar(
-        x=comp_df['Measure'],
-        y=comp_df['National Avg'],
-        name='National Avg',
-        marker_color=colors['National Avg'],
-        text=comp_df['National Avg'].round(1).astype(str) + '%',
-        textposition='outside',
-        textfont=dict(size=14)
-    ))
-    export_fig.update_layout(
-        barmode='group',
-        xaxis_title='Measure',
-        yaxis_title='Score (%)',
-        plot_bgcolor='white',
-        paper_bgcolor='white',
-        showlegend=True,
-        legend=dict(
-            orientation='h',
-            yanchor='bottom',
-            y=1.02,
-            xanchor='center',
-            x=0.5,
-            font=dict(size=14)
-        ),
-        margin=dict(t=100),
-        font=dict(size=16),
-        xaxis=dict(
-            tickfont=dict(size=16),  # Larger for PowerPoint
-            title=dict(
-                text='Measure',
-                font=dict(size=18)
-            )
-        ),
-        yaxis=dict(
-            tickfont=dict(size=14),
-            title=dict(
-                text='Score (%)',
-                font=dict(size=18)
-            ),
-            range=[0, 100]
-        )
-    )
-    export_fig.update_xaxes(showline=False, showgrid=False)
-    export_fig.update_yaxes(showline=False, showgrid=True, gridcolor='lightgray')
-    export_fig.write_image(chart_path, width=1200, height=800)
-    slide.shapes.add_picture(chart_path, chart_left, chart_top, chart_width, chart_height)
+    chart_buf = render_chart_png(comp_df)
+    slide.shapes.add_picture(chart_buf, chart_left, chart_top, chart_width, chart_height)
     return prs
 
-def save_chart_as_image(fig):
-    tmp = tempfile.NamedTemporaryFile(delete=False, suffix='.png')
-    fig.write_image(tmp.name)
-    return tmp.name
-
 if st.button('Download PowerPoint Report'):
-    chart_img = save_chart_as_image(fig)
-    pptx = create_pptx(comp_df, hospital, chart_img)
-    tmp_pptx = tempfile.NamedTemporaryFile(delete=False, suffix='.pptx')
-    pptx.save(tmp_pptx.name)
-    with open(tmp_pptx.name, 'rb') as f:
-        st.download_button('Download Report', f, file_name=f"{hospital}_HCAHPS_Benchmark_{datetime.now().strftime('%Y%m%d')}.pptx")
-    os.remove(chart_img)
-    os.remove(tmp_pptx.name)
+    pptx = create_pptx(comp_df, hospital)
+    pptx_buf = io.BytesIO()
+    pptx.save(pptx_buf)
+    pptx_buf.seek(0)
+    st.download_button('Download Report', pptx_buf, file_name=f"{hospital}_HCAHPS_Benchmark_{datetime.now().strftime('%Y%m%d')}.pptx")